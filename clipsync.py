@@ -1,15 +1,118 @@
 #!/usr/bin/env python3
+import hashlib
+import logging
+import logging.handlers
+import os
+import select
+import shutil
+import signal
 import subprocess
-import traceback
+import sys
+import time
 from bs4 import BeautifulSoup
 
+try:
+    # Optional: C parser, much faster than BeautifulSoup's html.parser
+    from selectolax.parser import HTMLParser
+except ImportError:
+    HTMLParser = None
+
+try:
+    # Optional: xxh3 runs near memory bandwidth, ~25x faster than blake2b
+    from xxhash import xxh3_128_digest as hash128
+except ImportError:
+    def hash128(data: bytes) -> bytes:
+        """128-bit digest of data (blake2b fallback when xxhash is missing)."""
+        return hashlib.blake2b(data, digest_size=16).digest()
+
+try:
+    # Optional: read the X11 clipboard in-process instead of running
+    # clipnotify and xclip for every change
+    from Xlib import X, display as xdisplay, error as xerror
+    from Xlib.ext import xfixes
+except ImportError:
+    xdisplay = None
+
+log = logging.getLogger('clipsync')
+
 ##############################################################################
 #                           Utility Functions
 ##############################################################################
 
+class BufferedStdoutHandler(logging.handlers.MemoryHandler):
+    """
+    Keep log records in memory and write them to stdout in one write on
+    flush(): when the buffer is full, on errors, at exit (logging.shutdown)
+    and whenever the main loop goes idle.
+    """
+
+    def __init__(self, capacity: int = 64):
+        super().__init__(capacity, flushLevel=logging.ERROR)
+
+    def flush(self):
+        with self.lock:
+            if self.buffer:
+                sys.stdout.write(''.join(self.format(record) + '\n'
+                                         for record in self.buffer))
+                sys.stdout.flush()
+                self.buffer.clear()
+
+
+_command_cache: dict[str, bool] = {}
+
 def command_exists(cmd):
-    """Check if a command is available in PATH."""
-    return subprocess.run(['which', cmd], capture_output=True).returncode == 0
+    """Check if a command is available in PATH (cached)."""
+    found = _command_cache.get(cmd)
+    if found is None:
+        found = _command_cache[cmd] = shutil.which(cmd) is not None
+    return found
+
+READ_BUF_SIZE = 64 * 1024   # covers typical text payloads, one pipe's worth
+
+def read_command(cmd: list[str], buf: bytearray, timeout: float) -> bytes:
+    """
+    Run a command and return its stdout.
+
+    Output that fits in `buf` is read straight into it, so typical text
+    payloads need no allocations besides the returned bytes. Larger output
+    (images) continues as a list of chunks joined once at the end; `buf`
+    keeps its size and is reused by the next call.
+    Raises subprocess.TimeoutExpired if the command takes too long.
+    """
+    deadline = time.monotonic() + timeout
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE,
+                            stderr=subprocess.DEVNULL, bufsize=0)
+    fd = proc.stdout.fileno()
+
+    def wait_readable():
+        remaining = deadline - time.monotonic()
+        if remaining <= 0 or not select.select([fd], [], [], remaining)[0]:
+            raise subprocess.TimeoutExpired(cmd, timeout)
+
+    try:
+        n = 0
+        with memoryview(buf) as view:
+            while n < len(view):
+                wait_readable()
+                with view[n:] as free:
+                    got = os.readv(fd, [free])
+                if not got:
+                    with view[:n] as used:
+                        return bytes(used)
+                n += got
+            chunks = [bytes(view)]
+        while True:
+            wait_readable()
+            chunk = os.read(fd, READ_BUF_SIZE)
+            if not chunk:
+                return b''.join(chunks)
+            chunks.append(chunk)
+    except BaseException:
+        proc.kill()
+        raise
+    finally:
+        proc.stdout.close()
+        proc.wait()
 
 def decode_utf8(data: bytes) -> str:
     """Decode bytes to string (UTF-8) safely (replace errors)."""
@@ -20,263 +123,552 @@ def normalize_text(data: bytes) -> bytes:
     Normalize text data to reduce unnecessary re-copies.
     For example, strip trailing newlines/spaces.
     """
-    s = decode_utf8(data)
-    # Remove trailing newlines
-    s = s.strip('\r\n')
-    return s.encode('utf-8', errors='replace')
+    # Works on the bytes directly: NUL, CR and LF are single-byte code
+    # units that never occur inside a multi-byte UTF-8 sequence.
+    return data.rstrip(b'\x00').strip(b'\r\n')
+
+# 'text/' is a real prefix; the X11 atoms UTF8_STRING and STRING are listed
+# whole and match as prefixes of themselves, so one startswith() covers all.
+_TEXT_PREFIXES = ('text/', 'UTF8_STRING', 'STRING')
 
 def is_text_mime(mime: str) -> bool:
     """Check if the MIME type indicates textual data."""
-    if mime.startswith('text/'):
+    return mime.startswith(_TEXT_PREFIXES)
+
+# MIME priority, shared by both directions. Images (image/*) go between the
+# two groups, in the order the clipboard owner lists them.
+MIME_PRIORITY_BEFORE_IMAGES = (
+    'text/uri-list',    # file lists
+    'text/html',        # sometimes images in Firefox appear as HTML
+)
+MIME_PRIORITY_AFTER_IMAGES = (
+    'text/plain;charset=utf-8',
+    'text/plain',
+    'UTF8_STRING',
+)
+
+def pick_mime(targets: list[str]) -> str:
+    """Pick the preferred MIME type among the offered targets."""
+    offered = frozenset(targets)
+    for mime in MIME_PRIORITY_BEFORE_IMAGES:
+        if mime in offered:
+            return mime
+    for t in targets:
+        if t.startswith('image/'):
+            return t
+    for mime in MIME_PRIORITY_AFTER_IMAGES:
+        if mime in offered:
+            return mime
+    return 'text/plain;charset=utf-8'
+
+# Signatures of binary formats that some sources offer as text/plain
+MAGIC_MIMES = {
+    b'\x89PNG\r\n\x1a\n': 'image/png',
+    b'\xff\xd8\xff': 'image/jpeg',
+    b'GIF87a': 'image/gif',
+    b'GIF89a': 'image/gif',
+    b'%PDF-': 'application/pdf',
+}
+
+def is_binary(data: bytes) -> bool:
+    """Check if data is not text: invalid UTF-8 or NUL bytes inside."""
+    body = data.rstrip(b'\x00')  # X11 text may carry trailing NULs
+    if b'\x00' in body:
         return True
-    if mime in ('UTF8_STRING', 'STRING'):
+    try:
+        body.decode('utf-8')
+    except UnicodeDecodeError:
         return True
     return False
 
-##############################################################################
-#                  Wayland Clipboard (wl-copy / wl-paste)
-##############################################################################
-
-def list_wayland_targets() -> list[str]:
-    """Get the list of MIME types from the Wayland clipboard."""
-    try:
-        out = subprocess.run(['wl-paste', '-l'],
-                             capture_output=True, timeout=0.5, check=True)
-        return decode_utf8(out.stdout).splitlines()
-    except:
-        return []
+def sniff_mime(data: bytes) -> str | None:
+    """
+    Return the MIME type if data is binary and starts with a known signature.
+    The GIF and PDF signatures are plain ASCII, so text that merely starts
+    like one (e.g. b'%PDF-1.4 is ...') is checked and left alone.
+    """
+    for magic, mime in MAGIC_MIMES.items():
+        if data.startswith(magic):
+            return mime if is_binary(data) else None
+    return None
 
-def pick_wayland_mime() -> str:
+def content_hash(data: bytes, mime: str) -> bytes:
     """
-    MIME priority (Wayland → X11):
-      1) text/uri-list       (file lists)
-      2) text/html           (sometimes images in Firefox appear as HTML)
-      3) image/*             (raw images)
-      4) text/plain;charset=utf-8
-      5) text/plain
-      6) UTF8_STRING (fallback)
+    128-bit digest used to compare clipboard contents.
+    Text is normalized first, so both sides hash equal for the same text.
     """
-    targets = list_wayland_targets()
-    targets = list(dict.fromkeys(targets))  # remove duplicates if any
-
-    # 1) text/uri-list
-    if 'text/uri-list' in targets:
-        return 'text/uri-list'
-    # 2) text/html
-    if 'text/html' in targets:
-        return 'text/html'
-    # 3) image/*
-    for t in targets:
-        if t.startswith('image/'):
-            return t
-    # 4) text/plain;charset=utf-8
-    if 'text/plain;charset=utf-8' in targets:
-        return 'text/plain;charset=utf-8'
-    # 5) text/plain
-    if 'text/plain' in targets:
-        return 'text/plain'
-    # 6) fallback
-    if 'UTF8_STRING' in targets:
-        return 'UTF8_STRING'
-    return 'text/plain;charset=utf-8'
+    if is_text_mime(mime):
+        data = normalize_text(data)
+    return hash128(data)
 
-def get_wayland_clipboard() -> tuple[bytes, str]:
-    """Return (raw_data, mime) from Wayland clipboard."""
-    mime = pick_wayland_mime()
-    try:
-        out = subprocess.run(['wl-paste', '-t', mime],
-                             capture_output=True, timeout=0.8)
-        data = out.stdout
-        return (data, mime)
-    except:
-        traceback.print_exc()
-        return (b'', '')
-
-def set_wayland_clipboard(data: bytes, mime: str):
+# Stripped text of recent HTML payloads, keyed by digest of the raw HTML
+_stripped_html: dict[bytes, bytes] = {}
+
+def strip_html(data: bytes) -> bytes:
     """
-    Write data to Wayland clipboard.
-    If it's text, use text/plain;charset=utf-8.
-    Otherwise use the original MIME (e.g., image/png).
+    Return the text content of an HTML payload, encoded as UTF-8.
+    The last results are cached, since the same HTML is often fetched
+    again (e.g. several change events for one copy).
     """
-    try:
-        if is_text_mime(mime):
-            chosen_mime = 'text/plain;charset=utf-8'
+    key = hash128(data)
+    text = _stripped_html.get(key)
+    if text is None:
+        if HTMLParser is not None:
+            # selectolax takes the raw bytes, no decode needed. Unlike
+            # BeautifulSoup's get_text() it keeps script/style contents, so
+            # drop those first (office suites put CSS in the HTML they copy)
+            tree = HTMLParser(data)
+            tree.strip_tags(['script', 'style', 'template'])
+            cleaned_text = tree.text(separator='')
         else:
-            chosen_mime = mime
-        subprocess.run(['wl-copy', '-t', chosen_mime], input=data, check=True)
-    except:
-        traceback.print_exc()
+            cleaned_text = BeautifulSoup(decode_utf8(data), 'html.parser').get_text()
+        # Both parsers return valid text (no lone surrogates), so the
+        # strict fast-path encoder cannot fail here
+        text = cleaned_text.encode('utf-8')
+        if len(_stripped_html) >= 2:  # about one entry per side
+            _stripped_html.clear()
+        _stripped_html[key] = text
+    return text
+
+##############################################################################
+#                           Clipboard Access
+##############################################################################
+
+class Selection:
+    """
+    One clipboard (Wayland or X11), accessed through external commands.
+    Both sides share this code and differ only in the commands they run.
+    """
+
+    def __init__(self, name: str, list_cmd: tuple, get_cmd: tuple,
+                 set_cmd: tuple, watch_cmd: tuple, text_mime: str | None,
+                 tools: tuple):
+        self.name = name
+        self.tools = tools          # commands that must be in PATH
+        self.list_cmd = list_cmd    # prints the offered targets
+        self.get_cmd = get_cmd      # + MIME: prints the data
+        self.set_cmd = set_cmd      # + MIME: takes the data on stdin
+        self.watch_cmd = watch_cmd  # see Watcher
+        self.text_mime = text_mime  # MIME used to write text, None keeps it
+        self._buf = bytearray(READ_BUF_SIZE)  # reused for get()
+
+        # Sync state, used by main()
+        self.watcher = None
+        self.seen_serial = 0
+        # Digest of the last known content. Only the digest is kept, so
+        # large payloads (images) are not held between events.
+        self.last_hash = b''
+
+    def list_targets(self) -> list[str]:
+        """Get the list of MIME types from the clipboard."""
+        try:
+            out = subprocess.run(self.list_cmd,
+                                 capture_output=True, timeout=0.5, check=True)
+            return decode_utf8(out.stdout).splitlines()
+        except:
+            return []
+
+    def pick_mime(self, targets: list[str] | None = None) -> str:
+        """
+        Pick the MIME type to fetch from `targets`, listing them if not given.
+        See MIME_PRIORITY_* for the order.
+        """
+        if targets is None:
+            targets = self.list_targets()
+        return pick_mime(targets)
+
+    def get(self, targets: list[str] | None = None) -> tuple[bytes, str]:
+        """Return (raw_data, mime) from the clipboard."""
+        if targets == []:  # empty clipboard, nothing to fetch
+            return (b'', '')
+        mime = self.pick_mime(targets)
+        try:
+            return (self.fetch(mime), mime)
+        except:
+            log.exception("%s clipboard command failed", self.name)
+            return (b'', '')
+
+    def fetch(self, mime: str) -> bytes:
+        """Read the clipboard data as `mime`."""
+        return read_command([*self.get_cmd, mime], self._buf, timeout=0.8)
+
+    def set(self, data: bytes, mime: str):
+        """
+        Write data to the clipboard.
+        Text is written as `text_mime` if set, other data keeps its MIME.
+        """
+        try:
+            if is_text_mime(mime):
+                mime = self.text_mime or mime
+            subprocess.run([*self.set_cmd, mime], input=data, check=True)
+        except:
+            log.exception("%s clipboard command failed", self.name)
+
+    def start_watching(self):
+        self.watcher = Watcher(self.watch_cmd)
+
+    def stop_watching(self):
+        if self.watcher is not None:
+            self.watcher.stop()
+            self.watcher = None
+
+##############################################################################
+#                  Wayland Clipboard (wl-copy / wl-paste)
+##############################################################################
+
+# wl-clipboard is used rather than pywayland: core wl_data_device only
+# delivers selections to the focused surface, so a background client needs
+# the compositor-specific data-control protocols that wl-paste already
+# handles. Changes come from one long-lived 'wl-paste --watch', so each
+# change costs a single 'wl-paste -t'.
+#
+# Text is always written as text/plain;charset=utf-8.
+#
+# The watcher skips listing when wl-paste (>= 2.2) reports in
+# CLIPBOARD_STATE that the clipboard is empty or was cleared.
+WAYLAND = Selection(
+    'Wayland',
+    list_cmd=('wl-paste', '-l'),
+    get_cmd=('wl-paste', '-t'),
+    set_cmd=('wl-copy', '-t'),
+    watch_cmd=('wl-paste', '--watch', 'sh', '-c',
+               'case "$CLIPBOARD_STATE" in '
+               'nil|clear) ;; '
+               '*) wl-paste -l 2>/dev/null ;; '
+               'esac; echo'),
+    text_mime='text/plain;charset=utf-8',
+    tools=('wl-copy', 'wl-paste'),
+)
 
 ##############################################################################
 #                  X11 Clipboard (xclip)
 ##############################################################################
 
-def list_x11_targets() -> list[str]:
-    """Get the list of MIME types from the X11 clipboard."""
-    try:
-        out = subprocess.run(['xclip', '-selection', 'clipboard',
-                              '-o', '-t', 'TARGETS'],
-                             capture_output=True, timeout=0.5, check=True)
-        decoded = decode_utf8(out.stdout)
-        return decoded.splitlines()
-    except:
-        return []
-
-def pick_x11_mime() -> str:
+# Without python-xlib everything on the X11 side goes through external
+# tools: each change costs a 'clipnotify' run and an 'xclip -t TARGETS' in the
+# watcher loop, plus an 'xclip -o' for the data. With python-xlib installed,
+# reading happens in-process instead (see XlibSelection); xclip still writes,
+# since owning CLIPBOARD means serving every paste for as long as we own it.
+#
+# Note:
+#   If you copy an image, and then run 'xclip -o' (without '-t'), you'll likely
+#   get an error 'cannot convert CLIPBOARD selection to target STRING' because
+#   no text target is provided for an image. Use 'xclip -o -t image/png' instead.
+
+# Largest property read in one GetProperty, in 32-bit units
+_MAX_PROPERTY_LENGTH = 0x1fffffff
+
+class XlibConnection:
+    """A private X connection with an unmapped window to receive on."""
+
+    def __init__(self):
+        self.display = xdisplay.Display()
+        self.fd = self.display.fileno()
+        self.window = self.display.screen().root.create_window(
+            0, 0, 1, 1, 0, X.CopyFromParent,
+            event_mask=X.PropertyChangeMask)
+        self.clipboard = self.display.intern_atom('CLIPBOARD')
+        self.incr = self.display.intern_atom('INCR')
+        self.property = self.display.intern_atom('CLIPSYNC_DATA')
+
+    def wait_event(self, deadline: float):
+        """Return the next event, raising TimeoutError at the deadline."""
+        while not self.display.pending_events():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not select.select([self.fd], [], [], remaining)[0]:
+                raise TimeoutError("no reply from the CLIPBOARD owner")
+        return self.display.next_event()
+
+    def take_property(self):
+        """Read and delete our property in one request."""
+        return self.window.get_property(self.property, X.AnyPropertyType,
+                                        0, _MAX_PROPERTY_LENGTH, delete=True)
+
+    def close(self):
+        self.display.close()
+
+class XlibWatcher:
     """
-    MIME priority (X11 → Wayland):
-      1) text/uri-list
-      2) text/html
-      3) image/*
-      4) text/plain;charset=utf-8
-      5) text/plain
-      6) UTF8_STRING
+    Watcher replacement: CLIPBOARD owner changes arrive as XFixes events on
+    a connection of their own, so no clipnotify process is needed. Events
+    carry no targets (targets is None); they are read when fetching.
     """
-    targets = list_x11_targets()
 
-    if 'text/uri-list' in targets:
-        return 'text/uri-list'
-    if 'text/html' in targets:
-        return 'text/html'
-    for t in targets:
-        if t.startswith('image/'):
-            return t
-    if 'text/plain;charset=utf-8' in targets:
-        return 'text/plain;charset=utf-8'
-    if 'text/plain' in targets:
-        return 'text/plain'
-    if 'UTF8_STRING' in targets:
-        return 'UTF8_STRING'
-    return 'text/plain;charset=utf-8'
+    targets = None
+
+    def __init__(self):
+        self.conn = XlibConnection()
+        display = self.conn.display
+        if not display.has_extension('XFIXES'):
+            raise RuntimeError("X server has no XFIXES extension")
+        display.xfixes_query_version()
+        display.xfixes_select_selection_input(
+            self.conn.window, self.conn.clipboard,
+            xfixes.XFixesSetSelectionOwnerNotifyMask)
+        display.flush()
+        self.fd = self.conn.fd
+        self.serial = 0          # number of change events seen
+
+    def read(self) -> bool:
+        """Consume queued events. Returns False if the connection closed."""
+        display = self.conn.display
+        try:
+            for _ in range(display.pending_events()):
+                if isinstance(display.next_event(), xfixes.SetSelectionOwnerNotify):
+                    self.serial += 1
+        except xerror.ConnectionClosedError:
+            return False
+        return True
 
-def get_x11_clipboard() -> tuple[bytes, str]:
-    """Return (raw_data, mime) from X11 clipboard."""
-    mime = pick_x11_mime()
-    try:
-        out = subprocess.run(['xclip', '-selection', 'clipboard',
-                              '-o', '-t', mime],
-                             capture_output=True, timeout=0.8)
-        data = out.stdout
-        return (data, mime)
-    except:
-        traceback.print_exc()
-        return (b'', '')
-
-def set_x11_clipboard(data: bytes, mime: str):
+    def stop(self):
+        self.conn.close()
+
+class XlibSelection(Selection):
     """
-    Write data to X11 clipboard.
+    X11 clipboard read in-process with python-xlib: TARGETS and data come
+    through ConvertSelection, which needs no selection ownership. Writing
+    is inherited and still runs xclip.
 
-    Note:
-      If you copy an image, and then run 'xclip -o' (without '-t'), you'll likely
-      get an error 'cannot convert CLIPBOARD selection to target STRING' because
-      no text target is provided for an image. Use 'xclip -o -t image/png' instead.
+    Conversions use their own connection, not the watcher's, so events
+    they read never hide a wake-up from the main loop's select().
     """
-    try:
-        subprocess.run(["xclip", "-selection", "clipboard",
-                        "-t", mime],
-                       input=data, check=True)
-    except:
-        traceback.print_exc()
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.tools = ('xclip',)
+        self._conn = None
+
+    def _convert(self, target: str, timeout: float):
+        """
+        Ask the CLIPBOARD owner for `target` and return the property value
+        (bytes, or an array of atoms for TARGETS), or None if refused.
+        Large data comes as an INCR transfer and is collected here.
+        """
+        if self._conn is None:
+            self._conn = XlibConnection()
+        conn = self._conn
+        deadline = time.monotonic() + timeout
+        try:
+            conn.window.convert_selection(conn.clipboard,
+                                          conn.display.intern_atom(target),
+                                          conn.property, X.CurrentTime)
+            conn.display.flush()
+            event = conn.wait_event(deadline)
+            while event.type != X.SelectionNotify:
+                event = conn.wait_event(deadline)
+            # The owner sets the property, then sends SelectionNotify with
+            # it, or with property None if it cannot convert
+            if event.property == X.NONE:
+                return None
+            prop = conn.take_property()
+            if prop is None:
+                return None
+            if prop.property_type != conn.incr:
+                return prop.value
+
+            # INCR: deleting the property (done above) asks for the next
+            # chunk; a zero-length chunk ends the transfer
+            chunks = []
+            while True:
+                event = conn.wait_event(deadline)
+                if (event.type != X.PropertyNotify
+                        or event.atom != conn.property
+                        or event.state != X.PropertyNewValue):
+                    continue
+                prop = conn.take_property()
+                if prop is None or not prop.value:
+                    return b''.join(chunks)
+                chunks.append(prop.value)
+        except BaseException:
+            # A late reply would be taken for the next request's
+            conn.close()
+            self._conn = None
+            raise
+
+    def list_targets(self) -> list[str]:
+        """Get the list of MIME types from the clipboard."""
+        try:
+            atoms = self._convert('TARGETS', timeout=0.5)
+            if atoms is None:
+                return []
+            return [self._conn.display.get_atom_name(atom) for atom in atoms]
+        except:
+            return []
+
+    def get(self, targets: list[str] | None = None) -> tuple[bytes, str]:
+        """Return (raw_data, mime) from the clipboard."""
+        if targets is None:  # XlibWatcher events carry no targets
+            targets = self.list_targets()
+        return super().get(targets)
+
+    def fetch(self, mime: str) -> bytes:
+        """Read the clipboard data as `mime`."""
+        return bytes(self._convert(mime, timeout=0.8) or b'')
+
+    def start_watching(self):
+        self.watcher = XlibWatcher()
+
+    def stop_watching(self):
+        super().stop_watching()
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+X11 = (XlibSelection if xdisplay is not None else Selection)(
+    'X11',
+    list_cmd=('xclip', '-selection', 'clipboard', '-o', '-t', 'TARGETS'),
+    get_cmd=('xclip', '-selection', 'clipboard', '-o', '-t'),
+    set_cmd=('xclip', '-selection', 'clipboard', '-t'),
+    watch_cmd=('sh', '-c',
+               'while clipnotify -s clipboard; do '
+               'xclip -selection clipboard -o -t TARGETS 2>/dev/null; echo; '
+               'done'),
+    text_mime=None,
+    tools=('xclip', 'clipnotify'),
+)
+
+##############################################################################
+#                        Change Notifications
+##############################################################################
+
+# Each watcher is a long-lived process that prints the target list of its
+# clipboard, followed by a blank line, on every change. The main loop sleeps in
+# select() on the watchers and gets the targets along with the event, so it
+# does not have to list them again before fetching the data. An empty list
+# means there is nothing to fetch.
+
+# Quiet period that ends a burst of change events
+DEBOUNCE_SECONDS = 0.05
+# Longest a burst is collected before syncing anyway, so a watcher that
+# keeps firing (e.g. two clipboard owners fighting) cannot stall the sync
+DEBOUNCE_MAX_SECONDS = 0.2
+
+class Watcher:
+    """A clipboard change watcher and the events read from it so far."""
+
+    def __init__(self, cmd: tuple):
+        # Own process group, so stop() also reaches the watcher's children
+        self.proc = subprocess.Popen(cmd, stdout=subprocess.PIPE,
+                                     start_new_session=True)
+        self.fd = self.proc.stdout.fileno()
+        self.serial = 0          # number of change events seen
+        self.targets = []        # target list of the latest event
+        self._pending = b''
+        self._lines = []
+
+    def read(self) -> bool:
+        """
+        Consume available output. Returns False if the watcher exited.
+        Several queued events collapse into the latest one.
+        """
+        chunk = os.read(self.fd, 65536)
+        if not chunk:
+            return False
+        *lines, self._pending = (self._pending + chunk).split(b'\n')
+        for line in lines:
+            if line:
+                self._lines.append(decode_utf8(line))
+            else:
+                self.serial += 1
+                self.targets = self._lines
+                self._lines = []
+        return True
+
+    def stop(self):
+        try:
+            os.killpg(self.proc.pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+        self.proc.wait()
 
 ##############################################################################
 #                            Main Loop
 ##############################################################################
 
+def sync(src: Selection, dst: Selection):
+    """Copy src to dst if src reported a change with new content."""
+    watcher = src.watcher
+    if watcher.serial == src.seen_serial:
+        return
+    src.seen_serial = watcher.serial
+
+    (data, mime) = src.get(watcher.targets)
+
+    # Binary data mislabeled as text (e.g. an image offered only as
+    # text/plain) is hashed and written with its sniffed MIME, the same
+    # way its echo from the other side will be fetched.
+    if is_text_mime(mime):
+        mime = sniff_mime(data) or mime
+
+    if mime == 'text/html':
+        try:
+            data = strip_html(data)
+            mime = 'text/plain;charset=utf-8'  # Treat as plain text now
+            log.info("Stripped HTML from %s clipboard", src.name)
+        except Exception as e:
+            log.error("Error stripping HTML from %s: %s", src.name, e)
+            # data/mime are only reassigned on success, so the original
+            # HTML is still in hand - sync it as is
+
+    # Our own writes come back here as events; they match src.last_hash
+    # and are skipped, which breaks echo loops.
+    digest = content_hash(data, mime)
+    if data != b'' and digest != src.last_hash:
+        src.last_hash = digest
+        if digest != dst.last_hash:
+            log.info("[%s -> %s] MIME=%s", src.name, dst.name, mime)
+            dst.set(data, mime)
+            dst.last_hash = digest
+
 def main():
+    log_handler = BufferedStdoutHandler()
+    logging.basicConfig(level=logging.INFO, format='%(message)s',
+                        handlers=[log_handler])
+
     # Check required tools
-    for tool in ['wl-copy', 'wl-paste', 'xclip', 'clipnotify']:
+    for tool in [*WAYLAND.tools, *X11.tools]:
         if not command_exists(tool):
-            print(f"Error: '{tool}' not found in PATH.")
+            log.error("Error: '%s' not found in PATH.", tool)
             return
 
-    print("Starting Wayland X11 clipboard sync...")
-
-    # Store the last known data (bytes) + MIME for both sides
-    last_w_data = b''
-    last_w_mime = ''
-    last_x_data = b''
-    last_x_mime = ''
-
-    while True:
-        # clipnotify will wake up on any clipboard change
-        p = subprocess.Popen(['clipnotify'])
-        p.wait()  # Wait for a clipboard change
-
-        # Get current clipboard contents for both
-        (w_data, w_mime) = get_wayland_clipboard()
-        (x_data, x_mime) = get_x11_clipboard()
-
-        # ---> START HTML STRIPPING LOGIC <----
-        if w_mime == 'text/html':
-            try:
-                soup = BeautifulSoup(decode_utf8(w_data), 'html.parser')
-                cleaned_text = soup.get_text()
-                w_data = cleaned_text.encode('utf-8', errors='replace')
-                w_mime = 'text/plain;charset=utf-8'  # Treat as plain text now
-                print("Stripped HTML from Wayland clipboard")
-            except Exception as e:
-                print(f"Error stripping HTML from Wayland: {e}")
-                # Fallback or keep original data?
-                # For now, let's keep original if stripping fails
-                (w_data, w_mime) = get_wayland_clipboard() # Re-fetch original
-
-        if x_mime == 'text/html':
-            try:
-                soup = BeautifulSoup(decode_utf8(x_data), 'html.parser')
-                cleaned_text = soup.get_text()
-                x_data = cleaned_text.encode('utf-8', errors='replace')
-                x_mime = 'text/plain;charset=utf-8' # Treat as plain text now
-                print("Stripped HTML from X11 clipboard")
-            except Exception as e:
-                print(f"Error stripping HTML from X11: {e}")
-                # Fallback or keep original data?
-                (x_data, x_mime) = get_x11_clipboard() # Re-fetch original
-        # ---> END HTML STRIPPING LOGIC <----
-
-        # Normalize text data for comparison (if it's text)
-        norm_w_data = normalize_text(w_data) if is_text_mime(w_mime) else w_data
-        norm_x_data = normalize_text(x_data) if is_text_mime(x_mime) else x_data
-
-        # Sync Wayland → X11 if Wayland changed
-        if w_data != last_w_data and norm_w_data != norm_x_data:
-            if w_data != last_x_data:
-                print(f"[Wayland -> X11] MIME={w_mime}")
-                set_x11_clipboard(w_data, w_mime)
-                last_x_data = w_data
-                last_x_mime = w_mime
-
-            last_w_data = w_data
-            last_w_mime = w_mime
-
-        # Sync X11 → Wayland if X11 changed
-        elif x_data != last_x_data and norm_x_data != norm_w_data:
-            if x_data != last_w_data:
-                print(f"[X11 -> Wayland] MIME={x_mime}")
-                set_wayland_clipboard(x_data, x_mime)
-                last_w_data = x_data
-                last_w_mime = x_mime
-
-            last_x_data = x_data
-            last_x_mime = x_mime
-
-        # Both changed - pick Wayland priority
-        elif w_data != last_w_data and x_data != last_x_data:
-            print(f"[Conflict] Both changed. Preferring Wayland -> X11 (MIME={w_mime})")
-            if w_data != last_x_data:
-                set_x11_clipboard(w_data, w_mime)
-                last_x_data = w_data
-                last_x_mime = w_mime
-            last_w_data = w_data
-            last_w_mime = w_mime
+    log.info("Starting Wayland X11 clipboard sync...")
 
-        else:
-            # Possibly no real difference or empty data
-            if w_data != b'':
-                last_w_data = w_data
-                last_w_mime = w_mime
-            if x_data != b'':
-                last_x_data = x_data
-                last_x_mime = x_mime
+    selections = (WAYLAND, X11)
+    try:
+        for sel in selections:
+            sel.start_watching()
+        fds = [sel.watcher.fd for sel in selections]
+
+        while True:
+            # Going idle: write out what was logged for the last events
+            log_handler.flush()
+
+            # Sleep until either side reports a clipboard change
+            ready, _, _ = select.select(fds, [], [])
+
+            # Apps often change the clipboard several times per copy
+            # (browsers: TARGETS, then data). Drain events until both
+            # watchers stay quiet for DEBOUNCE_SECONDS, or for at most
+            # DEBOUNCE_MAX_SECONDS, then fetch once.
+            burst_end = time.monotonic() + DEBOUNCE_MAX_SECONDS
+            while ready:
+                for sel in selections:
+                    if sel.watcher.fd in ready and not sel.watcher.read():
+                        log.error("Error: %s clipboard watcher exited.", sel.name)
+                        return
+                remaining = burst_end - time.monotonic()
+                if remaining <= 0:
+                    break
+                ready, _, _ = select.select(fds, [], [],
+                                            min(DEBOUNCE_SECONDS, remaining))
+
+            # Only the side that changed is fetched. Wayland goes first so
+            # it wins when both sides change at once.
+            sync(WAYLAND, X11)
+            sync(X11, WAYLAND)
+    finally:
+        for sel in selections:
+            sel.stop_watching()
 
 
 if __name__ == '__main__':